@@ -1,15 +1,33 @@
+import hashlib
 import io
 import math
+import os
+import tempfile
 import zipfile
-import xml.etree.ElementTree as ET
 
+try:
+    # lxml (libxml2) parses large LandXML files much faster than the stdlib
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 
+try:
+    # SIMD tree hash, several times faster than hashlib on large uploads
+    import blake3
+except ImportError:
+    blake3 = None
+
 try:
     import ezdxf
+    from ezdxf.addons import iterdxf
 except Exception:
     ezdxf = None
 
@@ -24,48 +42,76 @@ st.set_page_config(
 if "page" not in st.session_state:
     st.session_state["page"] = "home"
 
-if "design_points_df" not in st.session_state:
-    st.session_state["design_points_df"] = None
+# (content digest, DataFrame) of the loaded design file, or None
+if "design_points" not in st.session_state:
+    st.session_state["design_points"] = None
 
 # -----------------------------------------------------------------------------
 # Parsers
 # -----------------------------------------------------------------------------
 
 
-def parse_landxml_points(xml_bytes):
+def _points_frame(names, eastings, northings, elevs, source):
     """
-    Parse LandXML <CgPoint> entries into a DataFrame with columns:
-    Name, Easting, Northing, Elevation
+    Build a design_points DataFrame from parallel column lists.
+    `source` may be a single label (broadcast to every row) or one label per row.
     """
-    tree = ET.parse(io.BytesIO(xml_bytes))
-    root = tree.getroot()
+    return pd.DataFrame({
+        "Name": names,
+        "Easting": np.asarray(eastings, dtype=np.float64),
+        "Northing": np.asarray(northings, dtype=np.float64),
+        "Elevation": np.asarray(elevs, dtype=np.float64),
+        "Source": source,
+    })
+
 
-    # LandXML files often use a namespace like {http://www.landxml.org/schema/LandXML-1.2}
-    # We detect it dynamically here.
-    ns_uri = root.tag.split('}')[0].strip('{')
-    ns = {"lx": ns_uri}
+def _parse_landxml_stream(fh):
+    """
+    Stream LandXML <CgPoint> entries from a binary file object into a dict of
+    column lists: Name, Easting, Northing, Elevation.
+    """
+    # LandXML files often use a namespace like {http://www.landxml.org/schema/LandXML-1.2},
+    # sometimes with a prefix, so we match CgPoint by local name in any namespace.
+    if HAVE_LXML:
+        context = ET.iterparse(fh, events=("end",), tag="{*}CgPoint", huge_tree=True)
+    else:
+        context = ET.iterparse(fh, events=("end",))
 
-    rows = []
-    for cg in root.findall(".//lx:CgPoint", ns):
+    names, eastings, northings, elevs = [], [], [], []
+    for _, cg in context:
+        # lxml already filters on the tag; the stdlib iterparse yields every element
+        if not HAVE_LXML and cg.tag.rpartition("}")[2] != "CgPoint":
+            continue
         name = cg.get("name", "")
-        text = (cg.text or "").strip().split()
+        text = (cg.text or "").split(None, 3)
+
+        # Free the element (and, under lxml, its already-read siblings) as we go
+        cg.clear()
+        if HAVE_LXML:
+            while cg.getprevious() is not None:
+                del cg.getparent()[0]
+
         if len(text) >= 3:
             try:
                 easting = float(text[0])
                 northing = float(text[1])
                 elev = float(text[2])
-                rows.append({
-                    "Name": name,
-                    "Easting": easting,
-                    "Northing": northing,
-                    "Elevation": elev,
-                    "Source": "LandXML"
-                })
             except ValueError:
                 continue
-    if rows:
-        return pd.DataFrame(rows)
-    return pd.DataFrame(columns=["Name", "Easting", "Northing", "Elevation", "Source"])
+            names.append(name)
+            eastings.append(easting)
+            northings.append(northing)
+            elevs.append(elev)
+    return {"Name": names, "Easting": eastings, "Northing": northings, "Elevation": elevs}
+
+
+def parse_landxml_points(xml_bytes):
+    """
+    Parse LandXML <CgPoint> entries into a DataFrame with columns:
+    Name, Easting, Northing, Elevation
+    """
+    cols = _parse_landxml_stream(io.BytesIO(xml_bytes))
+    return _points_frame(cols["Name"], cols["Easting"], cols["Northing"], cols["Elevation"], "LandXML")
 
 
 def parse_dxf_points(dxf_bytes):
@@ -76,38 +122,72 @@ def parse_dxf_points(dxf_bytes):
     if ezdxf is None:
         return pd.DataFrame(columns=["Name", "Easting", "Northing", "Elevation", "Source"])
 
-    doc = ezdxf.readmem(dxf_bytes)
-    msp = doc.modelspace()
-
-    rows = []
-
-    # 1) POINT entities
-    for e in msp.query("POINT"):
-        loc = e.dxf.location
-        rows.append({
-            "Name": f"POINT_{e.dxf.handle}",
-            "Easting": float(loc.x),
-            "Northing": float(loc.y),
-            "Elevation": float(loc.z),
-            "Source": "DXF/POINT"
-        })
-
-    # 2) INSERT entities (block references)
-    # We'll just take the insertion point as a "design point"
-    for e in msp.query("INSERT"):
-        ip = e.dxf.insert
-        rows.append({
-            "Name": f"BLK_{e.dxf.name}_{e.dxf.handle}",
-            "Easting": float(ip.x),
-            "Northing": float(ip.y),
-            "Elevation": float(ip.z),
-            "Source": "DXF/INSERT"
-        })
-
-    if rows:
-        return pd.DataFrame(rows)
-    else:
-        return pd.DataFrame(columns=["Name", "Easting", "Northing", "Elevation", "Source"])
+    # Stream modelspace entities with iterdxf instead of loading the whole document
+    # (tables, block library, audit) just to read two entity types.
+    # iterdxf.modelspace() wants a real file; single_pass_modelspace() reads streams
+    # but drops the last entity of the ENTITIES section, so we spool to disk.
+    # Only raw handles/block names are collected per entity; the display names
+    # are composed afterwards with vectorized string ops.
+    point_xyz, point_handles = [], []
+    insert_xyz, insert_handles, insert_blocks = [], [], []
+    fd, path = tempfile.mkstemp(suffix=".dxf")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(dxf_bytes)
+        for e in iterdxf.modelspace(path, types=("POINT", "INSERT")):
+            dxf = e.dxf
+            if e.dxftype() == "POINT":
+                # 1) POINT entities
+                point_xyz.append(dxf.location)
+                point_handles.append(dxf.handle)
+            else:
+                # 2) INSERT entities (block references)
+                # We'll just take the insertion point as a "design point"
+                insert_xyz.append(dxf.insert)
+                insert_handles.append(dxf.handle)
+                insert_blocks.append(dxf.name)
+    finally:
+        os.remove(path)
+
+    n_pts = len(point_xyz)
+    n = n_pts + len(insert_xyz)
+    xyz = np.array(point_xyz + insert_xyz, dtype=np.float64).reshape(n, 3)
+    names = pd.concat([
+        "POINT_" + pd.Series(point_handles, dtype=str),
+        "BLK_" + pd.Series(insert_blocks, dtype=str) + "_" + pd.Series(insert_handles, dtype=str),
+    ], ignore_index=True)
+
+    sources = ["DXF/POINT"] * n_pts + ["DXF/INSERT"] * (n - n_pts)
+    return _points_frame(names, xyz[:, 0], xyz[:, 1], xyz[:, 2], sources)
+
+
+def _root_is_landxml(fh):
+    """
+    Check the root element of an XML stream is <LandXML> (in any namespace).
+    Only reads as far as the root start tag, so prologs of any length and
+    UTF-16 documents are handled by the XML parser itself.
+    """
+    for _, root in ET.iterparse(fh, events=("start",)):
+        return root.tag.rpartition("}")[2] == "LandXML"
+    return False
+
+
+def _parse_lok_member(zf, info):
+    """
+    Parse one XML member of a .lok zip into LandXML columns,
+    or return None if it isn't LandXML or fails to parse.
+    """
+    try:
+        # Check the root first so config/metadata XML is skipped without
+        # a full parse, then stream straight from the archive so the
+        # inflated member never sits in memory as one bytes object.
+        with zf.open(info) as fh:
+            if not _root_is_landxml(fh):
+                return None
+        with zf.open(info) as fh:
+            return _parse_landxml_stream(fh)
+    except Exception:
+        return None
 
 
 def parse_lok_points(lok_bytes):
@@ -117,108 +197,218 @@ def parse_lok_points(lok_bytes):
     Many .lok files are actually zip containers that hold design data (often XML).
     We'll try to open as a zip; if successful, we scan all .xml files inside
     and reuse the LandXML parser to grab CgPoints.
+    Columns from every XML are collected first so we only build one DataFrame.
 
     If not a zip, we'll just return empty for now.
     """
-    rows = []
+    names, eastings, northings, elevs = [], [], [], []
     try:
         with zipfile.ZipFile(io.BytesIO(lok_bytes), "r") as zf:
-            for name in zf.namelist():
-                if name.lower().endswith(".xml"):
-                    try:
-                        xml_bytes = zf.read(name)
-                        df_xml = parse_landxml_points(xml_bytes)
-                        if not df_xml.empty:
-                            rows.append(df_xml)
-                    except Exception:
-                        continue
+            for info in zf.infolist():
+                # Skip entries under 200 bytes. This also skips a bare
+                # single-point LandXML file, which we accept as the cost.
+                if not info.filename.lower().endswith(".xml") or info.file_size < 200:
+                    continue
+                cols = _parse_lok_member(zf, info)
+                if cols is None:
+                    continue
+                names.extend(cols["Name"])
+                eastings.extend(cols["Easting"])
+                northings.extend(cols["Northing"])
+                elevs.extend(cols["Elevation"])
     except zipfile.BadZipFile:
         # not a zip container
         pass
 
-    if rows:
-        return pd.concat(rows, ignore_index=True)
-    return pd.DataFrame(columns=["Name", "Easting", "Northing", "Elevation", "Source"])
+    return _points_frame(names, eastings, northings, elevs, "LandXML")
+
+
+# Design file extension -> parser
+_PARSERS = {
+    ".xml": parse_landxml_points,
+    ".dxf": parse_dxf_points,
+    ".lok": parse_lok_points,
+}
+
+# Arrow-backed column types for the design_points frames we keep around
+_POINT_DTYPES = {
+    "Name": "string[pyarrow]",
+    "Easting": "float64[pyarrow]",
+    "Northing": "float64[pyarrow]",
+    "Elevation": "float64[pyarrow]",
+    "Source": "string[pyarrow]",
+}
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _parse_cached(ext, digest, _raw):
+    """
+    Parse raw design bytes with the parser registered for `ext` in _PARSERS,
+    returning a PyArrow-backed DataFrame.
+    Cached on (ext, content digest) so reruns with the same upload skip parsing;
+    the raw bytes themselves are left out of Streamlit's hashing.
+    """
+    df = _PARSERS[ext](_raw).astype(_POINT_DTYPES)
+
+    if not df.empty:
+        # Reset index just to be clean
+        df = df.reset_index(drop=True)
+    return df
+
+
+def _content_digest(raw):
+    """
+    Digest of uploaded bytes used as the parse/figure cache key.
+    BLAKE3 when installed, hashlib BLAKE2b otherwise.
+    """
+    if blake3 is not None:
+        return blake3.blake3(raw).digest()
+    return hashlib.blake2b(raw).digest()
 
 
 def load_design_file(uploaded_file):
     """
     Detect file type by extension and parse into a design_points DataFrame.
+    Returns (content digest, DataFrame); the digest keys the downstream caches.
     """
     if uploaded_file is None:
         return None
 
-    fname = uploaded_file.name.lower()
-
-    try:
-        raw = uploaded_file.read()
-    except Exception:
-        # Streamlit sometimes gives a SpooledTemporaryFile that supports .getvalue()
-        raw = uploaded_file.getvalue()
-
-    if fname.endswith(".xml"):
-        df = parse_landxml_points(raw)
-    elif fname.endswith(".dxf"):
-        df = parse_dxf_points(raw)
-    elif fname.endswith(".lok"):
-        df = parse_lok_points(raw)
-    else:
+    ext = os.path.splitext(uploaded_file.name.lower())[1]
+    if ext not in _PARSERS:
         st.error("Unsupported design format. Please upload .xml, .dxf, or .lok")
         return None
 
-    if df is not None and not df.empty:
-        # Reset index just to be clean
-        df = df.reset_index(drop=True)
-    return df
+    raw = uploaded_file.getvalue()
+    digest = _content_digest(raw)
+    return digest, _parse_cached(ext, digest, raw)
 
 
 # -----------------------------------------------------------------------------
 # Plot builders
 # -----------------------------------------------------------------------------
 
-def build_local_plan_view(df):
+# Above this many points, per-point text labels are never drawn
+LABEL_MAX_POINTS = 500
+
+# Above this many points the plots are decimated to one point per grid cell
+LOD_THRESHOLD = 5000
+
+# Largest float32 rounding error (in drawing units, i.e. metres) we accept for plotting
+PLOT_FLOAT32_TOLERANCE = 1e-3
+
+
+def _plot_coords(col):
+    """
+    Return a coordinate column as a numpy array for Plotly, downcast to float32
+    (half the bytes on the wire) when that stays within PLOT_FLOAT32_TOLERANCE.
+    Full projected-grid coordinates (e.g. Northing ~6,000,000) keep float64.
+    """
+    values = col.to_numpy(dtype=np.float64)
+    values32 = values.astype(np.float32)
+    if np.all(np.abs(values32 - values) <= PLOT_FLOAT32_TOLERANCE):
+        return values32
+    return values
+
+
+def decimate_points(df, max_points=LOD_THRESHOLD):
+    """
+    Thin a design_points DataFrame for plotting by binning Easting/Northing into
+    a grid of roughly `max_points` cells and keeping the first point in each cell.
+    """
+    if df is None or len(df) <= max_points:
+        return df
+
+    e = df["Easting"].to_numpy(dtype=np.float64, na_value=np.nan)
+    n = df["Northing"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Rows without a finite position can't be binned (or drawn), so drop them
+    finite = np.flatnonzero(np.isfinite(e) & np.isfinite(n))
+    if len(finite) <= max_points:
+        return df.iloc[finite]
+    e = e[finite]
+    n = n[finite]
+
+    width, height = np.ptp(e), np.ptp(n)
+    extent = max(width, height)
+    if extent == 0:
+        return df.iloc[finite[:1]]
+    # Size cells from the area so long, narrow layouts (walls, rail, roads) also
+    # get about `max_points` cells; the floor keeps a near-zero width from
+    # producing far more cells than that along the long side.
+    cell = max(math.sqrt(width * height / max_points), extent / max_points)
+
+    cell_x = np.floor_divide(e - e.min(), cell).astype(np.int64)
+    cell_y = np.floor_divide(n - n.min(), cell).astype(np.int64)
+    _, keep = np.unique(cell_x * (cell_y.max() + 1) + cell_y, return_index=True)
+    return df.iloc[finite[np.sort(keep)]]
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_local_plan_view(df_key, _df, show_labels=False):
     """
     Simple CAD-style 2D plan view (no basemap).
     Easting vs Northing, equal aspect.
+    Markers are drawn with WebGL; name labels are an opt-in SVG overlay for small sets.
+    Cached on `df_key` rather than by hashing the DataFrame on every rerun.
     """
+    df = _df
     if df is None or df.empty:
         return go.Figure()
 
+    xs = _plot_coords(df["Easting"])
+    ys = _plot_coords(df["Northing"])
+
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=df["Easting"],
-        y=df["Northing"],
-        mode="markers+text",
+    fig.add_trace(go.Scattergl(
+        x=xs,
+        y=ys,
+        mode="markers",
         text=df["Name"],
-        textposition="top center",
-        marker=dict(size=8),
+        marker=dict(size=6),
         name="Design Points"
     ))
 
+    if show_labels and len(df) < LABEL_MAX_POINTS:
+        fig.add_trace(go.Scatter(
+            x=xs,
+            y=ys,
+            mode="text",
+            text=df["Name"],
+            textposition="top center",
+            hoverinfo="skip",
+            showlegend=False
+        ))
+
     fig.update_layout(
         title="Local 2D Plan View (Design Points)",
         xaxis_title="Easting",
         yaxis_title="Northing",
-        legend=dict(orientation="h")
+        legend=dict(orientation="h"),
+        # keep the user's zoom/pan when the figure is rebuilt (e.g. LOD toggle)
+        uirevision="design_points"
     )
     # lock aspect ratio so X and Y scale equally like CAD
     fig.update_yaxes(scaleanchor="x", scaleratio=1)
     return fig
 
 
-def build_3d_orbit_view(df):
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_3d_orbit_view(df_key, _df, show_labels=False):
     """
     3D orbit/zoom view using Plotly scatter3d.
+    Cached on `df_key` rather than by hashing the DataFrame on every rerun.
     """
+    df = _df
     if df is None or df.empty:
         return go.Figure()
 
     fig = go.Figure()
     fig.add_trace(go.Scatter3d(
-        x=df["Easting"],
-        y=df["Northing"],
-        z=df["Elevation"],
-        mode="markers+text",
+        x=_plot_coords(df["Easting"]),
+        y=_plot_coords(df["Northing"]),
+        z=_plot_coords(df["Elevation"]),
+        mode="markers+text" if show_labels and len(df) < LABEL_MAX_POINTS else "markers",
         text=df["Name"],
         textposition="top center",
         marker=dict(size=4),
@@ -232,7 +422,8 @@ def build_3d_orbit_view(df):
             yaxis_title="Northing",
             zaxis_title="Elevation",
             aspectmode="data",
-        )
+        ),
+        uirevision="design_points"
     )
     return fig
 
@@ -242,6 +433,15 @@ def build_3d_orbit_view(df):
 # -----------------------------------------------------------------------------
 
 
+@st.cache_resource
+def _rig_image_bytes():
+    """
+    Read the home-page JPEG once per server process instead of on every rerun.
+    """
+    with open("rig_image.jpg", "rb") as f:
+        return f.read()
+
+
 def page_home():
     st.title("Piling QA Dashboard")
 
@@ -273,9 +473,10 @@ def page_home():
 
         # If user provided a design file, parse it and store it
         if design_file is not None:
-            df = load_design_file(design_file)
+            loaded = load_design_file(design_file)
+            df = loaded[1] if loaded is not None else None
             if df is not None and not df.empty:
-                st.session_state["design_points_df"] = df
+                st.session_state["design_points"] = loaded
                 st.success("Design data loaded.")
                 st.write(df.head())
 
@@ -284,19 +485,20 @@ def page_home():
                     st.session_state["page"] = "overview"
 
     with col_right:
-        st.image("rig_image.jpg", caption="Piling Rig", use_column_width=True)
+        st.image(_rig_image_bytes(), caption="Piling Rig", width="stretch")
 
 
 def page_overview():
     st.title("Overview: Design Points")
 
-    df = st.session_state.get("design_points_df", None)
+    design_points = st.session_state["design_points"]
 
-    if df is None or df.empty:
+    if design_points is None:
         st.warning("No design data loaded yet. Go back to Home and upload a design file.")
         if st.button("⬅ Back to Home"):
             st.session_state["page"] = "home"
         return
+    digest, df = design_points
 
     # Sidebar controls
     with st.sidebar:
@@ -307,20 +509,41 @@ def page_overview():
             index=0
         )
 
+        show_labels = st.checkbox(
+            "Show labels",
+            value=False,
+            help=f"Point names are only drawn for fewer than {LABEL_MAX_POINTS} points."
+        )
+
+        plot_df = df
+        if len(df) > LOD_THRESHOLD:
+            decimate = st.checkbox(
+                "Decimate for plotting",
+                value=True,
+                help=f"Plot about {LOD_THRESHOLD} evenly spread points instead of all of them."
+            )
+            if decimate:
+                plot_df = decimate_points(df)
+
         st.markdown("**Design Points Loaded:**")
         st.write(len(df))
+        if len(plot_df) < len(df):
+            st.caption(f"Plotting {len(plot_df)} of {len(df)} points.")
 
         if st.button("⬅ Back to Home"):
             st.session_state["page"] = "home"
 
+    # decimation is deterministic, so the row count tells full and thinned sets apart
+    plot_key = (digest, len(plot_df))
+
     # Main view
     if view_mode == "Local 2D Plan":
-        fig2d = build_local_plan_view(df)
-        st.plotly_chart(fig2d, use_container_width=True)
+        fig2d = build_local_plan_view(plot_key, plot_df, show_labels)
+        st.plotly_chart(fig2d, width="stretch")
 
     elif view_mode == "3D Orbit":
-        fig3d = build_3d_orbit_view(df)
-        st.plotly_chart(fig3d, use_container_width=True)
+        fig3d = build_3d_orbit_view(plot_key, plot_df, show_labels)
+        st.plotly_chart(fig3d, width="stretch")
 
     # Show raw data table for reference
     st.subheader("Design Points Data")
@@ -331,9 +554,10 @@ def page_overview():
 # Router
 # -----------------------------------------------------------------------------
 
-if st.session_state["page"] == "home":
+page = st.session_state["page"]
+if page == "home":
     page_home()
-elif st.session_state["page"] == "overview":
+elif page == "overview":
     page_overview()
 else:
     st.session_state["page"] = "home"